@@ -6,6 +6,31 @@ __author__ = """Stefan Holderbach"""
 __email__ = 'ho.steve@web.de'
 __version__ = '0.1.0'
 
-from pandasbikeshed.basic_ops import flat_corr
-from pandasbikeshed.fancyfilter import me
-import pandasbikeshed.plot
+import importlib
+import sys
+
+# Submodules and their exports are only imported on first access,
+# so that e.g. the filters do not pay for importing matplotlib, seaborn and scipy
+_SUBMODULES = ('basic_ops', 'fancyfilter', 'metapandas', 'plot')
+_EXPORTS = {'flat_corr': 'basic_ops', 'me': 'fancyfilter'}
+
+__all__ = ['flat_corr', 'me', 'plot']
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(f'{__name__}.{_EXPORTS[name]}'), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES) | set(_EXPORTS))
+
+
+if sys.version_info < (3, 7):
+    # Module level __getattr__ requires python 3.7
+    from pandasbikeshed.basic_ops import flat_corr
+    from pandasbikeshed.fancyfilter import me
+    import pandasbikeshed.plot
@@ -1,12 +1,360 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 
-def flat_corr(df, columnns=slice(None), method='pearson', ascending=False):
+def flat_corr(df, columnns=slice(None), method='pearson', ascending=False, top_k=None, min_abs=None,
+              block_size=1024, dtype=np.float64, engine='pandas', n_jobs=None, stats=False):
     """
     Computes correlation ignoring NaN values with `method` of the columns in `df`
+
+    With `top_k` or `min_abs` the correlation matrix is computed in tiles of `block_size` x `block_size` column pairs
+    and only the selected pairs are kept, so that wide frames never materialize the full matrix.
+    The tiled computation supports 'pearson' and 'spearman'. With missing values, 'spearman' ranks every column
+    once over its own non-missing values instead of over the rows both columns of a pair have in common.
+
+    Args:
+        top_k: int, optional
+            Only return the first `top_k` pairs of the sorted result
+        min_abs: float, optional
+            Only return pairs with an absolute correlation of at least `min_abs`
+        block_size: int
+            Number of columns per tile
+            default=1024
+        dtype: np.float64 or np.float32
+            Precision of the tiled computation, np.float32 halves the memory and is faster on wide frames
+            default=np.float64
+        engine: {'pandas', 'blas'}
+            Compute the full correlation matrix with `df.corr` or with `nan_corr`
+            default='pandas'
+        n_jobs: int, optional
+            Number of threads of `nan_corr`
+        stats: bool
+            Add the columns `n` (number of rows both columns have in common), `p_value` (two-sided test of
+            no correlation, like `scipy.stats.pearsonr` and `spearmanr`) and `q_value` (Benjamini-Hochberg).
+            With `top_k` or `min_abs` the q-values are conservative, as the ranks of the p-values of the
+            unselected pairs are unknown. Only supported for 'pearson' and 'spearman'.
+            default=False
+
     Returns: a dataframe with a sorted column named after `method` and a MultiIndex describing the pairings
     """
-    res = df.loc[:,columnns].corr(method)
+    if stats and method not in ('pearson', 'spearman'):
+        raise ValueError(f'stats are not supported for method {method!r}, use pearson or spearman')
+    if top_k is not None or min_abs is not None:
+        return _tiled_flat_corr(df.loc[:,columnns], method, ascending, top_k, min_abs, block_size, dtype, stats)
+    if engine == 'blas':
+        res, counts = nan_corr(df.loc[:,columnns], method, return_counts=True, block_size=block_size,
+                               n_jobs=n_jobs, dtype=dtype)
+    else:
+        res = df.loc[:,columnns].corr(method)
     res[np.tri(res.shape[0], dtype=np.bool)] = np.nan
     res = res.stack().dropna().sort_values(ascending=ascending).to_frame(name=method)
+    if stats:
+        if engine != 'blas':
+            valid = df.loc[:,columnns].select_dtypes(include=['number', 'bool']).notna().astype(np.float64)
+            counts = valid.T @ valid
+        n = counts.to_numpy()[counts.index.get_indexer(res.index.get_level_values(0)),
+                              counts.columns.get_indexer(res.index.get_level_values(1))]
+        _add_stats(res, method, np.rint(n).astype(np.int64))
+    return res
+
+
+def corr_p_values(r, n):
+    """
+    Two-sided p-values of the test of no correlation for correlation coefficients `r` of `n` observations
+
+    Vectorized equivalent of the p-values of `scipy.stats.pearsonr` and `scipy.stats.spearmanr` (t-distribution with
+    n - 2 degrees of freedom). NaN for fewer than 3 observations.
+    """
+    from scipy.special import betainc
+
+    r, n = np.asarray(r, dtype=np.float64), np.asarray(n, dtype=np.float64)
+    with np.errstate(all='ignore'):
+        df = n - 2
+        r = np.clip(r, -1, 1)
+        # Regularized incomplete beta function of df / (df + t**2) with t**2 = df * r**2 / (1 - r**2)
+        p = betainc(df / 2, 0.5, np.where(np.abs(r) < 1, 1 - r * r, 0.))
+    return np.where(df > 0, p, np.nan)
+
+
+def adjust_p_values(p, n_tests=None):
+    """
+    Benjamini-Hochberg adjusted p-values (q-values) controlling the false discovery rate
+
+    Args:
+        p: array-like of p-values, NaN values are ignored
+        n_tests: int, optional
+            Total number of tests, if `p` only contains a selection of them
+            default: number of non-NaN p-values
+
+    Returns:
+        np.ndarray
+    """
+    p = np.asarray(p, dtype=np.float64)
+    q = np.full(p.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    order = valid[np.argsort(p[valid], kind='stable')]
+    n_tests = len(order) if n_tests is None else n_tests
+    adjusted = p[order] * n_tests / np.arange(1, len(order) + 1)
+    q[order] = np.minimum(np.minimum.accumulate(adjusted[::-1])[::-1], 1.)
+    return q
+
+
+def _add_stats(res, method, n, n_tests=None):
+    res['n'] = n
+    res['p_value'] = corr_p_values(res[method].to_numpy(), n)
+    res['q_value'] = adjust_p_values(res['p_value'].to_numpy(), n_tests)
+
+
+def nan_corr(df, method='pearson', return_counts=False, block_size=1024, n_jobs=None, dtype=np.float64):
+    """
+    Computes the correlation matrix of the numeric columns of `df` over the rows both columns have in common
+
+    Equivalent to `df.corr(method)`, but the pairwise-complete sums are computed with matrix products of the
+    validity masks in tiles of `block_size` x `block_size` columns, which run in a thread pool.
+    For 'spearman' every column is ranked once over its own non-missing values,
+    with missing values this differs from `df.corr` ranking the rows every pair has in common.
+
+    Args:
+        method: {'pearson', 'spearman'}
+        return_counts: bool
+            Also return the number of rows both columns have in common.
+            default=False
+        block_size: int
+            Number of columns per tile
+            default=1024
+        n_jobs: int, optional
+            Number of threads
+            default: number of CPUs
+        dtype: np.float64 or np.float32
+            Precision of the computation
+            default=np.float64
+
+    Returns: correlation matrix as pd.DataFrame, with `return_counts` a tuple of the correlation and the count matrix
+    """
+    columns, values, valid, squares = _prepare_corr(df, method, dtype)
+    n_columns = len(columns)
+    corr = np.empty((n_columns, n_columns), dtype=dtype)
+    counts = np.empty((n_columns, n_columns), dtype=np.int64) if return_counts else None
+
+    def compute(tile):
+        block_i, block_j = tile
+        corr_tile, count_tile = _corr_tile(values, valid, squares, block_i, block_j)
+        corr[block_i, block_j] = corr_tile
+        corr[block_j, block_i] = corr_tile.T
+        if counts is not None:
+            counts[block_i, block_j] = count_tile
+            counts[block_j, block_i] = np.transpose(count_tile)
+
+    with ThreadPoolExecutor(n_jobs or os.cpu_count()) as pool:
+        list(pool.map(compute, _tiles(n_columns, block_size)))
+    corr = pd.DataFrame(corr, index=columns, columns=columns)
+    if counts is not None:
+        return corr, pd.DataFrame(counts, index=columns, columns=columns)
+    return corr
+
+
+def _tiles(n_columns, block_size):
+    """Blocks of columns (i, j) with i <= j covering the upper triangle of the correlation matrix"""
+    blocks = [slice(start, min(start + block_size, n_columns)) for start in range(0, n_columns, block_size)]
+    return [(block_i, block_j) for i, block_i in enumerate(blocks) for block_j in blocks[i:]]
+
+
+def _prepare_corr(df, method, dtype):
+    """Returns the columns and the centered values of the numeric columns of `df` with their validity masks"""
+    if method not in ('pearson', 'spearman'):
+        raise ValueError(f'Method {method!r} is not supported, use pearson or spearman')
+    data = df.select_dtypes(include=['number', 'bool'])
+    if method == 'spearman':
+        data = data.rank()
+    values = data.to_numpy(dtype=np.float64, copy=True)
+    with np.errstate(all='ignore'):
+        missing = np.isnan(values)
+        # Centering does not change the correlation, but keeps the sums of the tiles small
+        values -= np.nanmean(np.where(missing.all(axis=0), 0., values), axis=0)
+        if missing.any():
+            values[missing] = 0.
+            valid = (~missing).astype(dtype)
+            squares = np.square(values).astype(dtype)
+        else:
+            valid = squares = None
+            values /= np.linalg.norm(values, axis=0)
+    return data.columns, values.astype(dtype, copy=False), valid, squares
+
+
+def _corr_tile(values, valid, squares, block_i, block_j):
+    """Pearson correlation and number of common rows of the centered columns `block_i` with the columns `block_j`"""
+    x, y = values[:, block_i], values[:, block_j]
+    with np.errstate(all='ignore'):
+        if valid is None:
+            # Columns are scaled to unit norm
+            tile, n = x.T @ y, len(values)
+        else:
+            # Sums over the rows both columns of a pair have in common
+            valid_x, valid_y = valid[:, block_i], valid[:, block_j]
+            n = valid_x.T @ valid_y
+            sum_x, sum_y = x.T @ valid_y, valid_x.T @ y
+            var_x = squares[:, block_i].T @ valid_y - sum_x * sum_x / n
+            var_y = valid_x.T @ squares[:, block_j] - sum_y * sum_y / n
+            tile = (x.T @ y - sum_x * sum_y / n) / np.sqrt(var_x * var_y)
+            tile[(var_x <= 0) | (var_y <= 0)] = np.nan
+            n = np.rint(n).astype(np.int64)
+    tile = np.clip(tile, -1, 1)
+    if block_i == block_j:
+        # Like pandas, exactly 1 on the diagonal of non-constant columns
+        diagonal = np.arange(len(tile))
+        tile[diagonal, diagonal] = np.where(np.isnan(tile[diagonal, diagonal]), np.nan, 1.)
+    return tile, n
+
+
+def _tiled_flat_corr(df, method, ascending, top_k, min_abs, block_size, dtype, stats=False):
+    if top_k is not None and top_k < 0:
+        raise ValueError('top_k must be non-negative')
+    columns, values, valid, squares = _prepare_corr(df, method, dtype)
+    # Pairs found per tile as lists of (values, i, j, n), concatenated only once
+    found = [(np.empty(0, dtype=dtype),) + (np.empty(0, dtype=np.intp),) * 3]
+    n_found = 0
+    n_tests = 0
+    for block_i, block_j in _tiles(len(columns), block_size):
+        tile, n = _corr_tile(values, valid, squares, block_i, block_j)
+        keep = np.isfinite(tile)
+        if block_i == block_j:
+            keep &= np.triu(np.ones(tile.shape, dtype=bool), k=1)
+        if stats:
+            n_tests += np.count_nonzero(keep & (n > 2))
+        if min_abs is not None:
+            keep &= np.abs(tile) >= min_abs
+        i, j = np.nonzero(keep)
+        found.append((tile[i, j], i + block_i.start, j + block_j.start, np.broadcast_to(n, tile.shape)[i, j]))
+        n_found += len(i)
+        if top_k is not None and n_found > top_k:
+            # Bounded selection of the best pairs so far
+            found_values, found_i, found_j, found_n = (np.concatenate(parts) for parts in zip(*found))
+            best = np.argpartition(found_values if ascending else -found_values, top_k - 1)[:top_k] \
+                if top_k else np.empty(0, dtype=np.intp)
+            found = [(found_values[best], found_i[best], found_j[best], found_n[best])]
+            n_found = len(best)
+    found_values, found_i, found_j, found_n = (np.concatenate(parts) for parts in zip(*found))
+
+    order = np.lexsort((found_j, found_i, found_values if ascending else -found_values))
+    index = pd.MultiIndex.from_arrays([columns[found_i[order]], columns[found_j[order]]])
+    res = pd.DataFrame({method: found_values[order]}, index=index)
+    if stats:
+        _add_stats(res, method, found_n[order], n_tests)
     return res
+
+
+class CorrAccumulator(object):
+    """
+    Pearson correlation of the columns of a growing table, updated batch by batch
+
+    Holds the pairwise-complete counts, means and co-moments of every pair of columns, so that an update only costs
+    the size of the batch. Accumulators of separate parts of the rows can be merged.
+
+    e.g. `acc = CorrAccumulator().update(history)`, then `acc.update(new_rows).flat_corr()`
+
+    Args:
+        columns: list-like, optional
+            Columns to correlate.
+            default: the numeric columns of the first batch
+    """
+
+    def __init__(self, columns=None):
+        self.columns = pd.Index(columns) if columns is not None else None
+        self._n = self._mean = self._m2 = self._comoment = None
+
+    def __repr__(self):
+        n_columns = len(self.columns) if self.columns is not None else 0
+        return f'CorrAccumulator(<{n_columns} columns>)'
+
+    def update(self, df):
+        """
+        Adds the rows of the batch `df`, columns missing in `df` count as missing values
+
+        Returns:
+            self
+        """
+        if self.columns is None:
+            self.columns = df.select_dtypes(include=['number', 'bool']).columns
+        values = df.reindex(columns=self.columns).to_numpy(dtype=np.float64, copy=True)
+        return self._merge(*_batch_moments(values))
+
+    def merge(self, other):
+        """
+        Adds the rows accumulated by `other`, e.g. by another worker
+
+        Returns:
+            self
+        """
+        if other._n is None:
+            return self
+        if self.columns is None:
+            self.columns = other.columns
+        elif not self.columns.equals(other.columns):
+            raise ValueError('Can only merge accumulators of the same columns')
+        return self._merge(other._n, other._mean, other._m2, other._comoment)
+
+    def _merge(self, n, mean, m2, comoment):
+        if self._n is None:
+            self._n, self._mean, self._m2, self._comoment = n, mean, m2, comoment
+            return self
+        # Pairwise combination of the moments of two parts of the rows (Chan et al.)
+        total = self._n + n
+        with np.errstate(all='ignore'):
+            weight = np.where(total > 0, self._n * n / total, 0.)
+            delta = mean - self._mean
+            self._comoment = self._comoment + comoment + delta * delta.T * weight
+            self._m2 = self._m2 + m2 + delta * delta * weight
+            self._mean = self._mean + delta * np.where(total > 0, n / total, 0.)
+        self._n = total
+        return self
+
+    def counts(self):
+        """Returns the number of rows every pair of columns has in common as pd.DataFrame"""
+        n = self._n if self._n is not None else np.zeros((len(self.columns),) * 2)
+        return pd.DataFrame(np.rint(n).astype(np.int64), index=self.columns, columns=self.columns)
+
+    def corr(self):
+        """Returns the correlation matrix, like `df.corr()` of all rows added so far"""
+        if self._n is None:
+            return pd.DataFrame(np.nan, index=self.columns, columns=self.columns)
+        with np.errstate(all='ignore'):
+            res = self._comoment / np.sqrt(self._m2 * self._m2.T)
+            res[(self._m2 <= 0) | (self._m2.T <= 0)] = np.nan
+        res = np.clip(res, -1, 1)
+        diagonal = np.arange(len(res))
+        res[diagonal, diagonal] = np.where(np.isnan(res[diagonal, diagonal]), np.nan, 1.)
+        return pd.DataFrame(res, index=self.columns, columns=self.columns)
+
+    def flat_corr(self, ascending=False):
+        """
+        Returns the correlations of all rows added so far in the format of `flat_corr`
+
+        Returns: a dataframe with a sorted column named 'pearson' and a MultiIndex describing the pairings
+        """
+        res = self.corr()
+        res[np.tri(res.shape[0], dtype=bool)] = np.nan
+        return res.stack().dropna().sort_values(ascending=ascending).to_frame(name='pearson')
+
+
+def _batch_moments(values):
+    """
+    Pairwise-complete moments of the columns of `values`
+
+    Returns: counts, means and second moments of column i over the rows it has in common with column j at [i, j],
+        and the co-moments of the pairs
+    """
+    missing = np.isnan(values)
+    valid = (~missing).astype(np.float64)
+    with np.errstate(all='ignore'):
+        values[missing] = 0.
+        shift = values.sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+        values -= shift
+        values[missing] = 0.
+        n = valid.T @ valid
+        sums = values.T @ valid
+        mean_shifted = np.where(n > 0, sums / n, 0.)
+        m2 = np.where(n > 0, np.square(values).T @ valid - sums * mean_shifted, 0.)
+        comoment = np.where(n > 0, values.T @ values - sums * mean_shifted.T, 0.)
+    return n, mean_shifted + shift[:, None], m2, comoment
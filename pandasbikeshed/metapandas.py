@@ -5,46 +5,68 @@ import pandas as pd
 # TODO: find a solution to implement nice metadata formats
 
 
-def read_with_metadata_dict(filename):
+def read_with_metadata_dict(filename, chunksize=None, engine=None, **read_csv_kwargs):
     """
+    Reads a tab separated file with a leading block of '# var_name: value' lines in one pass over the file
+
+    The data is parsed from the same file handle, starting at the first line after the metadata block.
+    Lines starting with '#' after the block are not treated as comments.
+
+    Args:
+        filename: str or path
+        chunksize: int, optional
+            Return an iterator of (chunk, metadata) with `chunksize` rows per chunk
+        engine: {'c', 'python', 'pyarrow'}, optional
+            Parser of `pd.read_csv`
+        **read_csv_kwargs: passed to `pd.read_csv`
+
     Returns: data, metadata
     """
-    metadata = {}
-    with open(filename) as fh:
-        # Process a contiguous block of metadata
-        # format '# var_name: value'
-        for line in fh:
-            if line.startswith('#'):
-                lsplits = line.strip().split(' ')
-                try:
-                    meta = int(lsplits[2])
-                except ValueError:
-                    meta = lsplits[2]
-                metadata[lsplits[1][:-1]] = meta
-            else:
-                break
-    data = pd.read_csv(filename, sep='\t', comment='#', )
+    if chunksize is not None:
+        return _iter_with_metadata_dict(filename, chunksize, engine, read_csv_kwargs)
+    with open(filename, 'rb') as fh:
+        metadata = _read_metadata(fh)
+        data = pd.read_csv(fh, sep='\t', engine=engine, **read_csv_kwargs)
     return data, metadata
 
-def read_only_metadata_dict(filename):
-  """
-  Returns: metadata
-  """
-  metadata = {}
-  with open(filename) as fh:
+def _iter_with_metadata_dict(filename, chunksize, engine, read_csv_kwargs):
+    with open(filename, 'rb') as fh:
+        metadata = _read_metadata(fh)
+        # The reader is only a context manager from pandas 1.2 on
+        reader = pd.read_csv(fh, sep='\t', engine=engine, chunksize=chunksize, **read_csv_kwargs)
+        try:
+            for chunk in reader:
+                yield chunk, metadata
+        finally:
+            reader.close()
+
+def _read_metadata(fh):
+    """
+    Parses the metadata block of a binary file handle and leaves it positioned at the start of the data
+    """
+    metadata = {}
     # Process a contiguous block of metadata
     # format '# var_name: value'
-    for line in fh:
-      if line.startswith('#'):
-        lsplits = line.strip().split(' ')
+    while True:
+        start = fh.tell()
+        line = fh.readline()
+        if not line.startswith(b'#'):
+            fh.seek(start)
+            break
+        lsplits = line.decode().strip().split(' ')
         try:
-          meta = int(lsplits[2])
+            meta = int(lsplits[2])
         except ValueError:
-          meta = lsplits[2]
+            meta = lsplits[2]
         metadata[lsplits[1][:-1]] = meta
-      else:
-        break
-  return metadata
+    return metadata
+
+def read_only_metadata_dict(filename):
+    """
+    Returns: metadata
+    """
+    with open(filename, 'rb') as fh:
+        return _read_metadata(fh)
 
 def write_with_metadata_dict(filename, data, metadata):
     metadata_str = metadata_to_str(metadata)
@@ -1,52 +1,229 @@
+import os
+import pickle
+import tempfile
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
 import numpy as np
 import pandas as pd
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import seaborn as sns
+from scipy.signal import fftconvolve
 from scipy.stats import pearsonr, spearmanr
 
+from pandasbikeshed.basic_ops import flat_corr, nan_corr
+
 
-def robust_hist(x, ax=None, **kwargs):
+def robust_hist(x, ax=None, mask=None, **kwargs):
     """
     Wrapper function to `plt.hist` dropping values that are not finite
 
+    Args:
+        mask: array-like of bool, optional
+            Precomputed finite values
+
     Returns:
         Axes
     """
-    mask = np.isfinite(x)
+    if mask is None:
+        mask = np.isfinite(x)
     ax = ax or plt.gca()
     ax.hist(x[mask], **kwargs)
     return ax
 
-def robust_scatter(x, y, size=0.5, alpha=0.3, **kwargs):
+def robust_scatter(x, y, size=0.5, alpha=0.3, density_threshold=200000, mask=None, **kwargs):
     """
     Wrapper function to `sns.scatterplot` dropping value pairs that are not finite
 
     Sets default `size` of 0.5 and `alpha` to 0.3
+    Above `density_threshold` finite pairs the density is drawn as image instead (see `robust_density`).
+
+    Args:
+        mask: array-like of bool, optional
+            Precomputed finite pairs
 
     Returns:
         Axes
     """
-    mask = np.isfinite(x) & np.isfinite(y)
+    if mask is None:
+        mask = np.isfinite(x) & np.isfinite(y)
+    if density_threshold is not None and np.count_nonzero(mask) > density_threshold:
+        return robust_density(x, y, mask=mask, ax=kwargs.get('ax'))
     return sns.scatterplot(x[mask], y[mask], size=size, alpha=alpha, **kwargs)
 
-def robust_kde(x, y=None, **kwargs):
+def robust_density(x, y, bins=256, cmap='viridis', log=True, ax=None, mask=None, **kwargs):
+    """
+    Draws the density of the finite value pairs as 2D histogram image, independent of the number of points
+
+    Args:
+        bins: int or (int, int)
+            Resolution of the image in x and y
+            default=256
+        cmap: str or Colormap
+            default='viridis'
+        log: bool
+            Logarithmic color scale of the counts
+            default=True
+        mask: array-like of bool, optional
+            Precomputed finite pairs
+        **kwargs: passed to `ax.imshow`
+
+    Returns:
+        Axes
+    """
+    # The color of a PairGrid is replaced by the colormap
+    kwargs.pop('color', None)
+    if mask is None:
+        mask = np.isfinite(x) & np.isfinite(y)
+    x_values = np.asarray(x, dtype=np.float64)[np.asarray(mask)]
+    y_values = np.asarray(y, dtype=np.float64)[np.asarray(mask)]
+    x_bins, y_bins = (bins, bins) if np.ndim(bins) == 0 else bins
+    (x_low, x_high), x_index = _bin_index(x_values, x_bins)
+    (y_low, y_high), y_index = _bin_index(y_values, y_bins)
+    counts = np.bincount(y_index * x_bins + x_index, minlength=x_bins * y_bins).reshape(y_bins, x_bins)
+    ax = ax or plt.gca()
+    norm = mpl.colors.LogNorm(vmin=1, vmax=max(counts.max(), 1)) if log else None
+    ax.imshow(np.ma.masked_equal(counts, 0), origin='lower', extent=(x_low, x_high, y_low, y_high),
+              aspect='auto', interpolation='nearest', cmap=cmap, norm=norm, **kwargs)
+    ax.set_xlabel(getattr(x, 'name', None) or '')
+    ax.set_ylabel(getattr(y, 'name', None) or '')
+    return ax
+
+def _bin_index(values, n_bins):
+    """Returns the range and the bin of every value for `n_bins` equal bins"""
+    if len(values):
+        low, high = values.min(), values.max()
+    else:
+        low, high = 0., 1.
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    index = ((values - low) * (n_bins / (high - low))).astype(np.intp)
+    np.minimum(index, n_bins - 1, out=index)
+    return (low, high), index
+
+def robust_kde(x, y=None, fft_threshold=100000, mask=None, **kwargs):
     """
     Wrapper function to `sns.kdeplot` dropping values or value pairs that are not finite
 
+    Above `fft_threshold` finite values the density is estimated by linear binning onto the grid and FFT convolution
+    with the kernel instead, with the bandwidth of `sns.kdeplot` (Scott's rule times `bw_adjust`).
+    Its cost is nearly independent of the number of values. It supports the arguments
+    `bw_adjust`, `gridsize`, `cut`, `levels` and `thresh` of `sns.kdeplot`, further arguments are passed to
+    `ax.plot` or `ax.contour`.
+
+    Args:
+        mask: array-like of bool, optional
+            Precomputed finite values or value pairs
+
     Returns:
         Axes
     """
     if y is not None:
-        mask = np.isfinite(x) & np.isfinite(y)
+        if mask is None:
+            mask = np.isfinite(x) & np.isfinite(y)
+        if fft_threshold is not None and np.count_nonzero(mask) > fft_threshold:
+            return _binned_kde_2d(np.asarray(x)[np.asarray(mask)], np.asarray(y)[np.asarray(mask)],
+                                  getattr(x, 'name', None), getattr(y, 'name', None), **kwargs)
         return sns.kdeplot(x[mask], y[mask], **kwargs)
     else:
-        mask = np.isfinite(x)
+        if mask is None:
+            mask = np.isfinite(x)
+        if fft_threshold is not None and np.count_nonzero(mask) > fft_threshold:
+            return _binned_kde_1d(np.asarray(x)[np.asarray(mask)], getattr(x, 'name', None), **kwargs)
         return sns.kdeplot(x[mask], **kwargs)
 
+def binned_kde(x, y=None, bw_adjust=1, gridsize=200, cut=3):
+    """
+    Gaussian kernel density estimate of finite values on a grid by linear binning and FFT convolution
 
+    Bandwidth and grid follow `sns.kdeplot`: Scott's rule times `bw_adjust`,
+    `gridsize` points from `cut` bandwidths below the minimum to `cut` bandwidths above the maximum.
 
-def robust_info(x, y, ax=None, **kwargs):
+    Returns:
+        (grid, density) for `x` only, (x grid, y grid, density of shape (len(y grid), len(x grid))) for `x` and `y`,
+        None if the covariance of the values is singular (e.g. constant or collinear values)
+    """
+    data = np.atleast_2d(np.asarray(x, dtype=np.float64)) if y is None \
+        else np.vstack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    n_dims, n = data.shape
+    if n < 2:
+        return None
+    factor = n ** (-1. / (n_dims + 4)) * bw_adjust
+    covariance = np.atleast_2d(np.cov(data, ddof=1)) * factor ** 2
+    if not np.all(np.isfinite(covariance)) or np.linalg.matrix_rank(covariance) < n_dims:
+        return None
+    bandwidths = np.sqrt(np.diag(covariance))
+    grids = [np.linspace(values.min() - bw * cut, values.max() + bw * cut, gridsize)
+             for values, bw in zip(data, bandwidths)]
+    steps = [grid[1] - grid[0] if grid[1] > grid[0] else 1. for grid in grids]
+
+    # Linear binning: every value is split onto its two neighbouring grid points per dimension
+    counts = np.zeros((gridsize,) * n_dims)
+    positions = [(values - grid[0]) / step for values, grid, step in zip(data, grids, steps)]
+    lower = [np.clip(np.floor(position).astype(np.intp), 0, gridsize - 2) for position in positions]
+    upper_weights = [np.clip(position - low, 0, 1) for position, low in zip(positions, lower)]
+    for corner in np.ndindex(*(2,) * n_dims):
+        index = 0
+        weights = np.ones(n)
+        for low, weight, offset in zip(lower, upper_weights, corner):
+            index = index * gridsize + low + offset
+            weights = weights * (weight if offset else 1 - weight)
+        counts += np.bincount(index, weights, minlength=gridsize ** n_dims).reshape(counts.shape)
+
+    # Kernel on all offsets between grid points, the density is its convolution with the counts
+    offsets = np.meshgrid(*[np.arange(-(gridsize - 1), gridsize) * step for step in steps], indexing='ij')
+    offsets = np.stack([offset.ravel() for offset in offsets])
+    precision = np.linalg.inv(covariance)
+    kernel = np.exp(-0.5 * np.sum(offsets * (precision @ offsets), axis=0))
+    kernel = kernel.reshape((2 * gridsize - 1,) * n_dims) / np.sqrt(np.linalg.det(2 * np.pi * covariance))
+    density = np.clip(fftconvolve(counts, kernel, mode='same') / n, 0, None)
+    if y is None:
+        return grids[0], density
+    # Rows along y like np.meshgrid and ax.contour
+    return grids[0], grids[1], density.T
+
+def _binned_kde_1d(x, name=None, ax=None, bw_adjust=1, gridsize=200, cut=3, **kwargs):
+    ax = ax or plt.gca()
+    estimate = binned_kde(x, bw_adjust=bw_adjust, gridsize=gridsize, cut=cut)
+    if estimate is None:
+        return _skip_kde(ax)
+    grid, density = estimate
+    ax.plot(grid, density, **kwargs)
+    ax.set_xlabel(name or '')
+    ax.set_ylabel('Density')
+    return ax
+
+def _binned_kde_2d(x, y, x_name=None, y_name=None, ax=None, bw_adjust=1, gridsize=200, cut=3,
+                   levels=10, thresh=0.05, color=None, **kwargs):
+    ax = ax or plt.gca()
+    estimate = binned_kde(x, y, bw_adjust=bw_adjust, gridsize=gridsize, cut=cut)
+    if estimate is None:
+        return _skip_kde(ax)
+    x_grid, y_grid, density = estimate
+    if np.ndim(levels) == 0:
+        # Iso-proportion levels of the probability mass like sns.kdeplot
+        values = np.sort(density.ravel())[::-1]
+        proportions = np.cumsum(values) / values.sum()
+        levels = np.take(values, np.searchsorted(proportions, 1 - np.linspace(thresh, 1, levels)), mode='clip')
+        levels = np.unique(levels[levels > 0])
+    if color is not None and 'cmap' not in kwargs:
+        kwargs['colors'] = [color]
+    ax.contour(x_grid, y_grid, density, levels=levels, **kwargs)
+    ax.set_xlabel(x_name or '')
+    ax.set_ylabel(y_name or '')
+    return ax
+
+def _skip_kde(ax):
+    # Like sns.kdeplot
+    warnings.warn('Dataset has 0 variance; skipping density estimate.', UserWarning)
+    return ax
+
+def robust_info(x, y, ax=None, stats=None, mask=None, **kwargs):
     """
     Prints correlation information of two arrays into axis.
 
@@ -54,13 +231,25 @@ def robust_info(x, y, ax=None, **kwargs):
     As non finite value pairs are dropped prints number of comparisons.
     Pearson and Spearman correlation values with associated p-value.
 
+    Args:
+        stats: dict, optional
+            Precomputed statistics of all pairs of columns, `flat_corr(..., stats=True)` by method.
+            Used if `x` and `y` are named columns of the pairs.
+        mask: array-like of bool, optional
+            Precomputed finite pairs
+
     Returns:
         Axes
     """
-    mask = np.isfinite(x) & np.isfinite(y)
-    n = np.sum(mask)
-    pear_r, pear_p = pearsonr(x[mask], y[mask])
-    spea_r, spea_p = spearmanr(x[mask], y[mask])
+    info = _lookup_stats(stats, getattr(x, 'name', None), getattr(y, 'name', None))
+    if info is None:
+        if mask is None:
+            mask = np.isfinite(x) & np.isfinite(y)
+        n = np.sum(mask)
+        pear_r, pear_p = pearsonr(x[mask], y[mask])
+        spea_r, spea_p = spearmanr(x[mask], y[mask])
+    else:
+        n, pear_r, pear_p, spea_r, spea_p = info
     ax = ax or plt.gca()
     ax.annotate(
              f'N = {n} \n'
@@ -73,30 +262,130 @@ def robust_info(x, y, ax=None, **kwargs):
              **kwargs)
     return ax
 
-def robust_pairplot(df, lower_kind='scatter', upper_kind='info', diag_kind='hist', **kwargs):
+def _pair_stats(df):
+    """Correlation statistics of all pairs of numeric columns over their finite value pairs, in one batch"""
+    finite = df.select_dtypes(include='number')
+    finite = finite.where(np.isfinite(finite))
+    # pandas ranks the finite pairs of every pair of columns for Spearman
+    return {'pearson': flat_corr(finite, method='pearson', engine='blas', stats=True),
+            'spearman': flat_corr(finite, method='spearman', engine='pandas', stats=True)}
+
+def _lookup_stats(stats, x_name, y_name):
+    """Returns (n, pearson r, pearson p, spearman r, spearman p) of a pair of columns or None"""
+    if stats is None or x_name is None or y_name is None:
+        return None
+    rows = []
+    for method in ('pearson', 'spearman'):
+        res = stats[method]
+        for pair in ((x_name, y_name), (y_name, x_name)):
+            if pair in res.index:
+                rows.append(res.loc[pair])
+                break
+        else:
+            return None
+    pearson, spearman = rows
+    return int(pearson['n']), pearson['pearson'], pearson['p_value'], spearman['spearman'], spearman['p_value']
+
+def robust_pairplot(df, lower_kind='scatter', upper_kind='info', diag_kind='hist', max_points=None, seed=0,
+                    **kwargs):
     """
     Similar function to `sns.pairplot` that drops non-finite value pairs instead of all rows containing NaNs
 
+    The finite values of every column are determined once, the panels draw from the columns without copying them.
+    The statistics of the 'info' panels are computed for all pairs at once (see `basic_ops.flat_corr`).
+
     Args:
-        lower_kind: {'scatter', 'kde', 'info'}
-        upper_kind: {'scatter', 'kde', 'info'}
+        lower_kind: {'scatter', 'density', 'kde', 'info'}
+        upper_kind: {'scatter', 'density', 'kde', 'info'}
         diag_kind: {'hist', 'kde'}
+        max_points: int, optional
+            Draw every panel except 'info' from a random sample of at most `max_points` of its finite values
+        seed: int
+            Seed of the random sample, the same seed draws the same sample
+            default=0
         **kwargs: passed to sns.PairGrid
 
     Returns:
         sns.PairGrid
     """
     diag_methods = {'hist': robust_hist, 'kde': robust_kde}
-    tria_methods = {'scatter': robust_scatter, 'kde': robust_kde, 'info': robust_info}
+    tria_methods = {'scatter': robust_scatter, 'density': robust_density, 'kde': robust_kde, 'info': robust_info}
     g = sns.PairGrid(df, **kwargs)
-    g.map_diag(diag_methods[diag_kind])
-    g.map_upper(tria_methods[upper_kind])
-    g.map_lower(tria_methods[lower_kind])
+    if kwargs.get('hue') is not None:
+        g.map_diag(diag_methods[diag_kind])
+        g.map_upper(tria_methods[upper_kind])
+        g.map_lower(tria_methods[lower_kind])
+        return g
+
+    if 'info' in (lower_kind, upper_kind):
+        # Panels of the same pairs are only computed once for all subplots
+        tria_methods['info'] = partial(robust_info, stats=_pair_stats(df))
+    pairs = _PreparedPairs(df, max_points, seed)
+    g.map_diag(pairs.diagonal(diag_methods[diag_kind]))
+    for i, y_var in enumerate(g.y_vars):
+        for j, x_var in enumerate(g.x_vars):
+            if i == j or g.axes[i, j] is None:
+                continue
+            kind = upper_kind if i < j else lower_kind
+            plt.sca(g.axes[i, j])
+            pairs.draw(tria_methods[kind], x_var, y_var, sample=kind != 'info')
+    for i, row in enumerate(g.axes):
+        for j, ax in enumerate(row):
+            if ax is not None:
+                ax.set_xlabel(g.x_vars[j] if i == len(g.axes) - 1 else '')
+                ax.set_ylabel(g.y_vars[i] if j == 0 else '')
     return g
 
+class _PreparedPairs(object):
+    """Finite masks of the columns of a frame, computed once, and deterministic samples of their finite pairs"""
+
+    def __init__(self, df, max_points=None, seed=0):
+        self.df = df
+        self.max_points = max_points
+        self.seed = seed
+        self._finite = {}
+        self._order = None
+
+    def finite(self, name):
+        if name not in self._finite:
+            self._finite[name] = np.isfinite(self.df[name].to_numpy(dtype=np.float64))
+        return self._finite[name]
+
+    def sample(self, mask):
+        """Returns the sorted positions of a uniform random sample of at most `max_points` of the True positions"""
+        if self.max_points is None or np.count_nonzero(mask) <= self.max_points:
+            return None
+        if self._order is None:
+            # One random order of the rows for all panels, the first `max_points` finite rows form the sample
+            self._order = np.random.RandomState(self.seed).permutation(len(mask))
+        return np.sort(self._order[mask[self._order]][:self.max_points])
+
+    def draw(self, func, x_var, y_var, sample=True):
+        mask = self.finite(x_var) & self.finite(y_var)
+        x, y = self.df[x_var], self.df[y_var]
+        rows = self.sample(mask) if sample else None
+        if rows is not None:
+            return func(x.iloc[rows], y.iloc[rows], mask=np.ones(len(rows), dtype=bool))
+        return func(x, y, mask=mask)
+
+    def diagonal(self, func):
+        """Wraps `func` for `sns.PairGrid.map_diag`"""
+
+        def draw_diagonal(x, hue=None, hue_order=None, palette=None, **kwargs):
+            # Accepting `hue` avoids the grouping of the whole frame by the grid
+            mask = self.finite(x.name)
+            rows = self.sample(mask)
+            if rows is not None:
+                return func(x.iloc[rows], mask=np.ones(len(rows), dtype=bool), **kwargs)
+            return func(x, mask=mask, **kwargs)
+
+        return draw_diagonal
+
 def corr_heatmap(df, method='pearson', triangle_only=True,
-                 ax=None,
+                 ax=None, engine='pandas',
                  cmap='RdBu_r', linewidths=0.1,
+                 cluster=False, raster=None, raster_threshold=200,
+                 max_pixels=1024, max_ticks=50,
                  **heat_map_kwargs):
     """
     Plot a correlation heatmap directly from a dataframe
@@ -107,24 +396,102 @@ def corr_heatmap(df, method='pearson', triangle_only=True,
         triangle_only: bool
             Hide the diagonal and upper triangle.
             default=True
+        engine: {'pandas', 'blas'}
+            Compute the correlation matrix with `df.corr` or with the multi-threaded `basic_ops.nan_corr`
+            default='pandas'
+        cluster: bool
+            Order the columns by average linkage hierarchical clustering on the distance 1 - r
+            default=False
+        raster: bool, optional
+            Draw the matrix as a single image instead of one patch per cell (`heat_map_kwargs` are not used).
+            default: above `raster_threshold` columns, unless `heat_map_kwargs` are given
+        max_pixels: int
+            Raster mode: average blocks of cells down to at most `max_pixels` per side
+        max_ticks: int
+            Raster mode: maximum number of labeled columns per axis
 
     Returns:
         Axes
     """
-    corrmat = df.corr(method=method)
+    if engine == 'blas':
+        corrmat = nan_corr(df, method=method)
+    else:
+        corrmat = df.corr(method=method)
+    if cluster:
+        order = _cluster_order(corrmat.to_numpy())
+        corrmat = corrmat.iloc[order, order]
     mask = (~np.tri(corrmat.shape[0], dtype=np.bool)) if triangle_only else None
     locator = mpl.ticker.MultipleLocator(0.25)
+    if raster is None:
+        raster = corrmat.shape[0] > raster_threshold and not heat_map_kwargs
+    if raster:
+        if heat_map_kwargs:
+            warnings.warn(f'Raster mode ignores the heatmap arguments {sorted(heat_map_kwargs)}.', UserWarning)
+        return _raster_heatmap(corrmat, mask, ax=ax, cmap=cmap, locator=locator,
+                               max_pixels=max_pixels, max_ticks=max_ticks)
     return sns.heatmap(corrmat, ax=ax, mask=mask,
                        vmin=-1., vmax=1., center=0, cbar_kws={'ticks': locator},
                        linewidths=linewidths, cmap=cmap,
                        **heat_map_kwargs)
 
+def _cluster_order(corr):
+    """Leaf order of the average linkage clustering of a correlation matrix"""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+    dist = 1. - np.nan_to_num(corr, nan=0.)
+    dist = np.clip((dist + dist.T) / 2., 0., 2.)
+    np.fill_diagonal(dist, 0.)
+    if len(dist) < 2:
+        return np.arange(len(dist))
+    return leaves_list(linkage(squareform(dist, checks=False), method='average'))
+
+def _block_mean(values, factor):
+    """Mean of the finite values in `factor` x `factor` blocks, NaN for blocks without any"""
+    n = values.shape[0]
+    m = -(-n // factor)
+    padded = np.full((m * factor, m * factor), np.nan)
+    padded[:n, :n] = values
+    finite = np.isfinite(padded)
+    blocks = np.where(finite, padded, 0.).reshape(m, factor, m, factor)
+    counts = finite.reshape(m, factor, m, factor).sum(axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return blocks.sum(axis=(1, 3)) / counts
+
+def _raster_heatmap(corrmat, mask, ax=None, cmap='RdBu_r', locator=None, max_pixels=1024, max_ticks=50):
+    """Draws the matrix as one image in the coordinates of `sns.heatmap` (cell i spans [i, i + 1])"""
+    if ax is None:
+        ax = plt.gca()
+    n = corrmat.shape[0]
+    values = corrmat.to_numpy(dtype=np.float64, copy=True)
+    if mask is not None:
+        values[mask] = np.nan
+    factor = max(1, -(-n // max_pixels))
+    if factor > 1:
+        values = _block_mean(values, factor)
+    image = ax.imshow(np.ma.masked_invalid(values), cmap=cmap, vmin=-1., vmax=1., interpolation='nearest',
+                      aspect='auto', extent=(0, values.shape[1] * factor, values.shape[0] * factor, 0))
+    ax.set_xlim(0, n)
+    ax.set_ylim(n, 0)
+    ax.figure.colorbar(image, ax=ax, ticks=locator)
+    step = max(1, -(-n // max_ticks))
+    ticks = np.arange(0, n, step)
+    ax.set_xticks(ticks + 0.5)
+    ax.set_xticklabels(corrmat.columns[ticks], rotation=90)
+    ax.set_yticks(ticks + 0.5)
+    ax.set_yticklabels(corrmat.index[ticks])
+    for side in ax.spines.values():
+        side.set_visible(False)
+    return ax
+
 def dist_catplot(data=None, x=None, kind='hist', dist_columns=None,
                  col=None, row=None, hue=None, col_wrap=None,
+                 bins=10, shared_bins=False,
                  **facet_kwargs):
     """
     Make faceted histograms or kdeplots either from tidy longform data or columns of a wide DataFrame
 
+    Histograms of the columns of a wide DataFrame are counted directly from the columns without a longform copy.
+
     Args:
         data: pd.DataFrame
         x: str, None
@@ -137,6 +504,12 @@ def dist_catplot(data=None, x=None, kind='hist', dist_columns=None,
             Column names to facet the data.
         col_wrap: int, optional
             breaks cols, if no row specified
+        bins: int or sequence of bin edges
+            Bins of the histograms of wide data
+            default=10
+        shared_bins: bool
+            Use the same bin edges for all columns of wide data instead of the range of each column
+            default=False
 
     Returns:
         sns.FacetGrid
@@ -152,10 +525,6 @@ def dist_catplot(data=None, x=None, kind='hist', dist_columns=None,
         non_numeric_columns = data.columns.difference(numeric_columns)
         cols_name = data.columns.name or 'columns'
         hist_col = 'value' if 'value' not in data.columns else 'histogram_value'
-        dat = data.melt(id_vars=non_numeric_columns,
-                        value_vars=numeric_columns,
-                        var_name=cols_name,
-                        value_name=hist_col)
         if col is None:
             col = cols_name
         elif row is None and col_wrap is None:
@@ -164,10 +533,213 @@ def dist_catplot(data=None, x=None, kind='hist', dist_columns=None,
             hue = cols_name
         else:
             raise ValueError('No dimension available to unpack the numeric columns.')
+        if kind == 'hist':
+            return _wide_hist_grid(data, numeric_columns, cols_name, hist_col, bins, shared_bins,
+                                   col=col, row=row, hue=hue, col_wrap=col_wrap, **facet_kwargs)
+        dat = data.melt(id_vars=non_numeric_columns,
+                        value_vars=numeric_columns,
+                        var_name=cols_name,
+                        value_name=hist_col)
     else:
         dat = data
         hist_col = x
-    plt_funcs = {'hist': plt.hist, 'kde': sns.kdeplot}
+    plt_funcs = {'hist': plt.hist, 'kde': robust_kde}
     g = sns.FacetGrid(dat, col=col, row=row, hue=hue, col_wrap=col_wrap, **facet_kwargs)
     g.map(plt_funcs[kind], hist_col)
     return g
+
+def _wide_hist_grid(data, columns, cols_name, hist_col, bins, shared_bins, col=None, row=None, hue=None, **facet_kwargs):
+    """
+    Histograms of wide columns drawn into a `sns.FacetGrid` of one row per histogram
+
+    The other facet variables are counted in one pass per column with a grouped `np.bincount`.
+    """
+    facets = {'col': col, 'row': row, 'hue': hue}
+    others = [var for var in facets.values() if var is not None and var != cols_name]
+    if others:
+        grouped = data.groupby(others, sort=True, observed=True)
+        # Rows with a missing facet key are not in any group and get the code -1
+        codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.intp)
+        keys = grouped.size().index.to_frame(index=False)
+    else:
+        codes = np.zeros(len(data), dtype=np.intp)
+        keys = pd.DataFrame(index=[0])
+    n_groups = len(keys)
+    if shared_bins:
+        shared_edges = _hist_edges([data[name].to_numpy(dtype=np.float64) for name in columns], bins)
+    hists = []
+    frames = []
+    for name in columns:
+        values = data[name].to_numpy(dtype=np.float64)
+        edges = shared_edges if shared_bins else _hist_edges([values], bins)
+        n_bins = len(edges) - 1
+        index = _hist_index(values, edges)
+        valid = (index >= 0) & (codes >= 0)
+        counts = np.bincount(codes[valid] * n_bins + index[valid], minlength=n_groups * n_bins)
+        frame = keys.copy()
+        frame[cols_name] = name
+        frame[hist_col] = np.arange(len(hists), len(hists) + n_groups)
+        hists.extend((counts_i, edges) for counts_i in counts.reshape(n_groups, n_bins))
+        frames.append(frame)
+    dat = pd.concat(frames, ignore_index=True)
+    for facet, var in facets.items():
+        if var is not None and var != cols_name:
+            # Facets in the order of the original data instead of the grouped keys
+            facet_kwargs.setdefault(f'{facet}_order', _facet_order(data[var]))
+    g = sns.FacetGrid(dat, col=col, row=row, hue=hue, **facet_kwargs)
+    g.map(partial(_draw_counts, hists), hist_col)
+    return g
+
+def _facet_order(values):
+    """Levels of a facet variable in the order `sns.FacetGrid` uses for the column of a frame"""
+    if pd.api.types.is_categorical_dtype(values):
+        return list(values.cat.categories)
+    order = list(pd.unique(values.dropna()))
+    if pd.api.types.is_numeric_dtype(values):
+        order.sort()
+    return order
+
+def _hist_edges(arrays, bins):
+    """Bin edges over the finite range of all arrays"""
+    if not np.isscalar(bins):
+        return np.asarray(bins, dtype=np.float64)
+    lo, hi = np.inf, -np.inf
+    for values in arrays:
+        finite = values[np.isfinite(values)]
+        if len(finite):
+            lo, hi = min(lo, finite.min()), max(hi, finite.max())
+    if lo > hi:
+        lo, hi = 0., 1.
+    return np.histogram_bin_edges([], bins=bins, range=(lo, hi))
+
+def _hist_index(values, edges):
+    """Bin of each value as `np.histogram` assigns it (last bin closed), -1 outside of the edges"""
+    n_bins = len(edges) - 1
+    index = np.searchsorted(edges, values, side='right') - 1
+    index[values == edges[-1]] = n_bins - 1
+    index[(index >= n_bins) | ~(values >= edges[0])] = -1
+    return index
+
+def _draw_counts(hists, ids, **kwargs):
+    ax = plt.gca()
+    for i in ids:
+        counts, edges = hists[i]
+        ax.hist(edges[:-1], bins=edges, weights=counts, **kwargs)
+    return ax
+
+def render_batch(specs, data=None, n_jobs=None, tmp_dir=None, **savefig_kwargs):
+    """
+    Render many figures in a pool of processes with the Agg backend
+
+    The frames in `data` are written once to memory-mapped files, the workers load each frame once instead of
+    receiving a pickled copy with every task.
+    The workers are spawned, scripts calling `render_batch` need an `if __name__ == '__main__':` guard.
+
+    Args:
+        specs: Iterable of dicts with the keys 'func', 'data', 'kwargs' and 'path' or tuples in that order
+            `func` is a plotting function (e.g. `dist_catplot`) returning Axes, a seaborn grid or a Figure,
+            it is called as `func(frame, **kwargs)` with the frame `data[spec['data']]`,
+            without a frame if `spec['data']` is None.
+            The figure is saved to `path`.
+        data: dict of pd.DataFrame or pd.DataFrame, optional
+            A single frame is referenced by the key 0
+        n_jobs: int, optional
+            Number of processes, 1 renders in the calling process
+            default: os.cpu_count()
+        tmp_dir: str, optional
+            Directory for the memory-mapped files (e.g. '/dev/shm')
+        **savefig_kwargs: passed to `Figure.savefig`
+
+    Returns:
+        pd.DataFrame with the columns 'path', 'time' (seconds) and 'error' (None on success) per spec
+    """
+    specs = [_batch_spec(spec) for spec in specs]
+    if isinstance(data, pd.DataFrame):
+        data = {0: data}
+    data = data or {}
+    n_jobs = min(n_jobs or os.cpu_count() or 1, max(len(specs), 1))
+    with tempfile.TemporaryDirectory(prefix='pandasbikeshed-', dir=tmp_dir) as directory:
+        if n_jobs == 1:
+            stores = data
+            results = [_render_task(spec, stores, savefig_kwargs) for spec in specs]
+        else:
+            stores = {key: _store_frame(frame, os.path.join(directory, str(i))) for i, (key, frame) in
+                      enumerate(data.items())}
+            with ProcessPoolExecutor(n_jobs, mp_context=get_context('spawn'), initializer=_init_render_worker,
+                                     initargs=(stores,)) as pool:
+                results = list(pool.map(_render_task, specs, [None] * len(specs), [savefig_kwargs] * len(specs)))
+    return pd.DataFrame(results, columns=['path', 'time', 'error'])
+
+def _batch_spec(spec):
+    if isinstance(spec, dict):
+        return spec['func'], spec.get('data', 0), spec.get('kwargs') or {}, spec['path']
+    func, key, kwargs, path = spec
+    return func, key, kwargs or {}, path
+
+def _store_frame(df, path):
+    """Writes the columns of numpy dtypes to one .npy file per dtype and pickles the rest"""
+    os.makedirs(path)
+    groups = {}
+    other = []
+    for i, dtype in enumerate(df.dtypes):
+        if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+            groups.setdefault(dtype.str, []).append(i)
+        else:
+            other.append(i)
+    blocks = []
+    for n, positions in enumerate(groups.values()):
+        file = os.path.join(path, f'{n}.npy')
+        # Rows of the stored array are the columns of the frame
+        np.save(file, np.ascontiguousarray(df.iloc[:, positions].to_numpy().T))
+        blocks.append((file, positions))
+    meta = os.path.join(path, 'frame.pickle')
+    with open(meta, 'wb') as f:
+        pickle.dump((df.index, df.columns, df.iloc[:, other], other), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return blocks, meta
+
+def _load_frame(blocks, meta):
+    with open(meta, 'rb') as f:
+        index, columns, rest, other = pickle.load(f)
+    parts = [(positions, pd.DataFrame(np.load(file, mmap_mode='r').T, index=index, copy=False))
+             for file, positions in blocks]
+    if other:
+        parts.append((other, rest))
+    if len(parts) == 1 and parts[0][0] == list(range(len(columns))):
+        # A single dtype block stays a view of the mapped file
+        df = parts[0][1]
+    else:
+        df = pd.concat([part for _, part in parts], axis=1)
+        df = df.iloc[:, np.argsort(np.concatenate([positions for positions, _ in parts]))]
+    df.columns = columns
+    return df
+
+_worker_stores = None
+_worker_frames = {}
+
+def _init_render_worker(stores):
+    global _worker_stores
+    plt.switch_backend('Agg')
+    _worker_stores = stores
+
+def _render_task(spec, frames=None, savefig_kwargs=None):
+    func, key, kwargs, path = spec
+    start = time.perf_counter()
+    try:
+        if key is None:
+            result = func(**kwargs)
+        else:
+            if frames is None:
+                if key not in _worker_frames:
+                    _worker_frames[key] = _load_frame(*_worker_stores[key])
+                frame = _worker_frames[key]
+            else:
+                frame = frames[key]
+            result = func(frame, **kwargs)
+        fig = getattr(result, 'fig', None) or getattr(result, 'figure', None) or result
+        fig.savefig(path, **(savefig_kwargs or {}))
+        plt.close(fig)
+        error = None
+    except Exception:
+        plt.close('all')
+        error = traceback.format_exc()
+    return path, time.perf_counter() - start, error
@@ -38,7 +38,7 @@ setup(
     setup_requires=setup_requirements,
     test_suite='tests',
     tests_require=test_requirements,
-    extras_require={'test': test_requirements},
+    extras_require={'test': test_requirements, 'arrow': ['pyarrow']},
     url='https://github.com/sholderbach/pandasbikeshed',
     version='0.1.0',
     zip_safe=False,
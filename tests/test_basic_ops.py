@@ -7,7 +7,7 @@ from scipy.special import comb
 
 import pytest
 
-from pandasbikeshed.basic_ops import flat_corr
+from pandasbikeshed.basic_ops import CorrAccumulator, adjust_p_values, flat_corr, nan_corr
 
 ex_df = pd_samples.makeDataFrame()
 ex_missing_df = pd_samples.makeMissingDataframe()
@@ -43,3 +43,75 @@ def test_flat_corr_nan_column():
     assert flat_corr(nan_col_df).shape[0] == comb(nan_col_df.shape[1], 2, exact=True)
 
 
+
+@pytest.mark.parametrize('frame', [ex_df, ex_missing_df])
+@pytest.mark.parametrize('ascending', [False, True])
+def test_flat_corr_top_k(frame, ascending):
+    full = flat_corr(frame, ascending=ascending)
+    res = flat_corr(frame, ascending=ascending, top_k=5, block_size=2)
+    assert res.index.equals(full.index[:5])
+    np.testing.assert_allclose(res['pearson'], full['pearson'][:5])
+    res32 = flat_corr(frame, ascending=ascending, top_k=5, dtype=np.float32)
+    np.testing.assert_allclose(res32['pearson'], full['pearson'][:5], atol=1e-5)
+
+@pytest.mark.parametrize('frame', [ex_df, ex_missing_df])
+def test_flat_corr_min_abs(frame):
+    full = flat_corr(frame)
+    res = flat_corr(frame, min_abs=0.1, block_size=3)
+    expected = full[full['pearson'].abs() >= 0.1]
+    assert res.index.equals(expected.index)
+    np.testing.assert_allclose(res['pearson'], expected['pearson'])
+    assert flat_corr(frame, min_abs=0.1, top_k=1).index.equals(expected.index[:1])
+
+def test_flat_corr_top_k_spearman():
+    np.testing.assert_allclose(flat_corr(ex_df, method='spearman', top_k=3)['spearman'],
+                               flat_corr(ex_df, method='spearman')['spearman'][:3])
+    with pytest.raises(ValueError):
+        flat_corr(ex_df, method='kendall', top_k=3)
+
+@pytest.mark.parametrize('method', ['pearson', 'spearman'])
+def test_nan_corr(method):
+    corr, counts = nan_corr(ex_missing_df, method=method, return_counts=True, block_size=3, n_jobs=2)
+    if method == 'pearson':
+        assert_frame_equal(corr, ex_missing_df.corr(method), check_exact=False)
+    else:
+        assert_frame_equal(nan_corr(ex_df, method=method), ex_df.corr(method), check_exact=False)
+    valid = ex_missing_df.notna().astype(np.int64)
+    assert_frame_equal(counts, valid.T @ valid)
+
+def test_flat_corr_blas():
+    assert_frame_equal(flat_corr(ex_missing_df, engine='blas'), flat_corr(ex_missing_df), check_exact=False)
+
+def test_corr_accumulator():
+    acc = CorrAccumulator()
+    for start in range(0, len(ex_missing_df), 7):
+        acc.update(ex_missing_df.iloc[start:start + 7])
+    assert_frame_equal(acc.corr(), ex_missing_df.corr(), check_exact=False)
+    assert_frame_equal(acc.flat_corr(), flat_corr(ex_missing_df), check_exact=False)
+    valid = ex_missing_df.notna().astype(np.int64)
+    assert_frame_equal(acc.counts(), valid.T @ valid)
+    first = CorrAccumulator().update(ex_missing_df.iloc[:10])
+    second = CorrAccumulator().update(ex_missing_df.iloc[10:]).update(ex_missing_df.iloc[:0])
+    assert_frame_equal(first.merge(second).merge(CorrAccumulator()).corr(), acc.corr(), check_exact=False)
+    with pytest.raises(ValueError):
+        first.merge(CorrAccumulator(columns=['A']).update(ex_missing_df))
+
+@pytest.mark.parametrize('engine', ['pandas', 'blas'])
+def test_flat_corr_stats(engine):
+    from scipy.stats import pearsonr
+    res = flat_corr(ex_missing_df, stats=True, engine=engine)
+    assert list(res.columns) == ['pearson', 'n', 'p_value', 'q_value']
+    for (x, y), row in res.iterrows():
+        mask = ex_missing_df[x].notna() & ex_missing_df[y].notna()
+        assert row['n'] == mask.sum()
+        np.testing.assert_allclose(row['p_value'], pearsonr(ex_missing_df[x][mask], ex_missing_df[y][mask])[1])
+    np.testing.assert_allclose(res['q_value'], adjust_p_values(res['p_value']))
+    top = flat_corr(ex_missing_df, stats=True, top_k=2)
+    assert_frame_equal(top.iloc[:, :3], res.iloc[:2, :3], check_exact=False)
+    assert (top['q_value'] >= res['q_value'][:2] - 1e-12).all()
+    with pytest.raises(ValueError):
+        flat_corr(ex_missing_df, method='kendall', stats=True, engine=engine)
+
+def test_adjust_p_values():
+    np.testing.assert_allclose(adjust_p_values([0.01, 0.04, 0.03, 0.2, np.nan, 0.005]),
+                               [0.025, 0.05, 0.05, 0.2, np.nan, 0.025])
@@ -165,3 +165,442 @@ def test_np_inverted_math():
 def test_chained_math():
     assert_series_equal(((me + 2) * 3 - 1)(ex_series), ((ex_series + 2) * 3 - 1))
     assert_series_equal((1 - (2 + me) * 3)(ex_series), (1 - (2 + ex_series) * 3))
+
+rng = np.random.RandomState(42)
+compile_df = pd.DataFrame({'a': rng.normal(size=100),
+                           'b': rng.randint(-3, 3, size=100),
+                           'c': rng.rand(100) > 0.5,
+                           'f': rng.normal(size=100).astype('float32'),
+                           's': rng.choice([*'xyz'], size=100)})
+compile_df.loc[::7, 'a'] = np.nan
+compile_df.loc[::11, 'a'] = np.inf
+compile_df.loc[::13, 'a'] = 0
+
+@pytest.mark.parametrize('expr', [(me.a > 1) & (me.b < me.a * 2),
+                                  ((me.a * 2 + 1) * (me.a - 3) / me.b) >= 0,
+                                  me.b / 0,
+                                  me.a // 0,
+                                  me.b % 2,
+                                  2 ** me.a,
+                                  -me.a,
+                                  -me.c,
+                                  ~me.c ^ (me.b == 1),
+                                  me.a.isna() | me.b.notna(),
+                                  me.a.isfinite(),
+                                  me.f * 2.5 + me.a,
+                                  (me.s == 'x') & (me.a > 0),
+                                  me.s.isin(['x', 'y']) | me.a.notin([0.])]
+)
+def test_compiled_identical(expr):
+    assert_series_equal(expr.compile()(compile_df), expr(compile_df, internal=True), check_exact=True)
+
+def test_compiled_fallback():
+    from pandasbikeshed.fancyfilter import OpsFilter
+    custom = OpsFilter(me.a, lambda x, inner: inner(x).abs())
+    assert_series_equal((custom > 1)(compile_df), compile_df.a.abs() > 1)
+    shuffled = compile_df.a.sample(frac=1, random_state=0)
+    assert_series_equal((me.a + shuffled)(compile_df), compile_df.a + shuffled)
+    assert_frame_equal((me > 0)(ex_df), ex_df > 0)
+
+def test_compiled_index_level():
+    indexed = compile_df.set_index(['s', 'b'])
+    assert_frame_equal(indexed[(me.s == 'x') & (me.b > 0)],
+                       indexed[(indexed.index.get_level_values('s') == 'x')
+                               & (indexed.index.get_level_values('b') > 0)])
+
+def test_repr():
+    assert repr(me) == 'me'
+    assert repr((me.a > 1) & ~me['b c'].isin([1, 2])) == "((me.a > 1) & (~me['b c'].isin([1, 2])))"
+    assert repr(2 - me.a) == '(2 - me.a)'
+
+def test_common_subexpressions():
+    from unittest import mock
+    import pandasbikeshed.fancyfilter as ff
+    indexed = compile_df.set_index(['s', 'b'])
+    expr = ((me.a > -1) & (me.a < 1)) | (me.a.isna() & (me.b > 0)) | ((me.a > -1) & (me.b < 2))
+    with mock.patch.object(ff, '_resolve_column', wraps=ff._resolve_column) as resolve:
+        result = expr(indexed)
+    assert resolve.call_count == 2
+    assert_series_equal(result, expr(indexed, internal=True).set_axis(indexed.index), check_names=False)
+    assert_series_equal(((me.a / 0.) - (me.a / -0.))(compile_df), compile_df.a / 0. - compile_df.a / -0.)
+
+@pytest.mark.parametrize('make_expr', [lambda df: (me.a > 0) & (me.b < 2) & me.c,
+                                       lambda df: (me.a > 0) | (me.b < 2) | (me.s == 'x'),
+                                       lambda df: ((me.a > 0) & (me.b < 2)) | (me.c & (me.s != 'y')),
+                                       lambda df: np.array(df.c) & (me.a > 0) & (me.b.isin([0, 1])),
+                                       lambda df: (me.a > 0) & True]
+)
+@pytest.mark.parametrize('reorder', [False, True])
+def test_short_circuit(make_expr, reorder):
+    large_df = pd.concat([compile_df] * 50, ignore_index=True)
+    for frame in [compile_df, large_df]:
+        expr = make_expr(frame)
+        assert_series_equal(expr.compile(short_circuit=True, reorder=reorder)(frame),
+                            expr(frame, internal=True), check_exact=True)
+
+def test_short_circuit_rows():
+    from pandasbikeshed.fancyfilter import OpsFilter
+    seen = []
+    counted = OpsFilter(me.a, lambda x, inner: seen.append(len(x)) or inner(x) > 0)
+    compile_df[((me.b == 1) & counted).compile(short_circuit=True)]
+    # Opaque operations are not necessarily element-wise and see all rows
+    assert seen == [len(compile_df)]
+    seen.clear()
+    compile_df[((me.b == 1) | counted).compile(short_circuit=True)]
+    assert seen == [len(compile_df)]
+    above_mean = OpsFilter(me.a, lambda x, inner: inner(x) > inner(x).mean())
+    for expr in [(me.b == 1) & above_mean, (me.b == 1) | ~above_mean]:
+        assert_series_equal(expr.compile(short_circuit=True)(compile_df), expr(compile_df, internal=True))
+
+@pytest.mark.parametrize('make_expr', [lambda: (me.a > 0) & (me.b <= 1),
+                                       lambda: ~((me.a > 0) | (me.s == 'x')),
+                                       lambda: (me.a != 0) & me.b.notin([0, 1]) & me.s.isin(['x', 'y']),
+                                       lambda: ~me.a.isfinite() | me.a.isna(),
+                                       lambda: (me.a * 2 > me.b) & (me.c ^ (me.b > 0)) & ~(me.s <= 'y'),
+                                       lambda: me.c & (me.part == 1)]
+)
+def test_read_parquet(tmp_path, make_expr):
+    pytest.importorskip('pyarrow')
+    from pandasbikeshed.fancyfilter import read_parquet
+    data = compile_df.assign(part=np.arange(len(compile_df)) % 3)
+    data.to_parquet(tmp_path / 'data.parquet', row_group_size=10)
+    data.to_parquet(tmp_path / 'dataset', partition_cols=['part'])
+    expr = make_expr()
+    expected = data.loc[expr]
+    assert_frame_equal(read_parquet(tmp_path / 'data.parquet', where=expr).reset_index(drop=True),
+                       expected.reset_index(drop=True))
+    assert_frame_equal(read_parquet(tmp_path / 'data.parquet', where=expr, columns=['b', 's']).reset_index(drop=True),
+                       expected.loc[:, ['b', 's']].reset_index(drop=True))
+    partitioned = read_parquet(tmp_path / 'dataset', where=expr, columns=['a', 'b', 'part'], partitioning='hive')
+    assert_frame_equal(partitioned.sort_values(['a', 'b', 'part']).reset_index(drop=True),
+                       expected.loc[:, ['a', 'b', 'part']].sort_values(['a', 'b', 'part']).reset_index(drop=True),
+                       check_dtype=False)
+
+def test_arrow_pushdown():
+    pytest.importorskip('pyarrow')
+    from pandasbikeshed.fancyfilter import arrow_pushdown
+    pushdown = arrow_pushdown((me.a > 0) & (me.b * 2 < 1) & me.s.isin(['x']))
+    assert pushdown.expression is not None
+    assert repr(pushdown.residual) == '((me.b * 2) < 1)'
+    assert pushdown.columns == {'a', 'b', 's'}
+    assert arrow_pushdown(np.ones(3, dtype=bool) & (me.a > 0)).expression is None
+
+def test_arrow_pushdown_schema(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    from pandasbikeshed.fancyfilter import arrow_pushdown, read_parquet
+    data = pd.DataFrame({'t': pd.date_range('2020-01-01', periods=10), 's': list('abcdefghij'),
+                         'n': np.arange(10), 'flag': np.arange(10) % 2 == 0})
+    schema = pa.Schema.from_pandas(data, preserve_index=False)
+    pushdown = arrow_pushdown((me.t > '2020-01-05') & (me.s == 1) & me.n & me.flag & (me.n > 2.5), schema)
+    assert repr(pushdown.residual) == "(((me.t > '2020-01-05') & (me.s == 1)) & me.n)"
+    data.to_parquet(tmp_path / 'data.parquet')
+    for expr in [me.t > '2020-01-05', me.s == 1, me.n, me.s.isin([1, 'a']), me.n == 2 ** 70]:
+        assert_frame_equal(read_parquet(tmp_path / 'data.parquet', where=expr).reset_index(drop=True),
+                           data.loc[expr].reset_index(drop=True))
+    nullable = pd.DataFrame({'I': pd.array(rng.choice([0, 1, 2, None], 100), dtype='Int64'),
+                             'f': rng.choice([0., 1., np.nan], 100),
+                             'S': pd.array(rng.choice(['a', 'b', None], 100), dtype='string')})
+    nullable.to_parquet(tmp_path / 'nullable.parquet')
+    for expr in [me.I != 1, ~(me.I > 1), ~(me.I == 1), me.S != 'a', me.I != me.f, (me.I > 0) & (me.f != 1)]:
+        assert_frame_equal(read_parquet(tmp_path / 'nullable.parquet', where=expr).reset_index(drop=True),
+                           nullable.loc[expr].reset_index(drop=True))
+
+def test_filtered_chunks():
+    from io import StringIO
+    from pandasbikeshed.fancyfilter import iter_filtered, read_filtered
+    csv = compile_df.to_csv(index=False)
+    full = pd.read_csv(StringIO(csv))
+    expected = full.loc[(me.a > 0) & (me.s != 'x'), ['a', 'b']]
+    chunks = pd.read_csv(StringIO(csv), chunksize=7)
+    assert_frame_equal(read_filtered(chunks, where=(me.a > 0) & (me.s != 'x'), columns=['a', 'b']), expected)
+    chunks = pd.read_csv(StringIO(csv), chunksize=7)
+    assert all(len(chunk) <= 7 for chunk in iter_filtered(chunks, where=me.a > 0))
+    empty = read_filtered(pd.read_csv(StringIO(csv), chunksize=7), where=me.b > 100)
+    assert empty.empty and list(empty.columns) == list(full.columns)
+
+def test_filtered_chunks_limit():
+    from pandasbikeshed.fancyfilter import read_filtered
+    consumed = []
+
+    def chunks():
+        try:
+            for start in range(0, len(compile_df), 10):
+                consumed.append(start)
+                yield compile_df.iloc[start:start + 10]
+        finally:
+            consumed.append('closed')
+
+    assert_frame_equal(read_filtered(chunks(), where=me.a > 0, limit=5), compile_df.loc[me.a > 0].iloc[:5])
+    assert consumed[-1] == 'closed' and len(consumed) < len(compile_df) // 10
+
+@pytest.mark.parametrize('short_circuit', [False, True])
+def test_parallel(short_circuit):
+    from pandasbikeshed.fancyfilter import CompiledFilter
+    large_df = pd.concat([compile_df] * 50, ignore_index=True)
+    for expr in [(me.a > 0) & ((me.b * 2 < me.a) | (me.s == 'x')), me.a * 2 + me.b, me.s.isin(['x']),
+                 (me.a > 0) & (me.b == [1] * len(large_df)), me.b.isin(np.arange(len(large_df)))]:
+        parallel = CompiledFilter(expr, short_circuit=short_circuit, n_threads=4, min_block_size=64)
+        assert_series_equal(parallel(large_df), expr(large_df, internal=True), check_exact=True)
+    assert_frame_equal(large_df.loc[(me.a > 0).parallel(n_threads=4)], large_df.loc[large_df.a > 0])
+
+@pytest.mark.parametrize('series,values', [(pd.Series(rng.randint(0, 100, 500)), list(range(0, 100, 3))),
+                                           (pd.Series(rng.randint(0, 100, 500), dtype='uint64'), [1, 5, 7]),
+                                           (pd.Series(rng.randint(0, 100, 500), dtype='uint8'), [1, -3, 300]),
+                                           (pd.Series(rng.randint(0, 100, 500)), [1., 2.5, np.nan]),
+                                           (pd.Series(rng.randint(0, 2, 500), dtype=bool), [1]),
+                                           (compile_df.a, [0., np.inf, np.nan]),
+                                           (compile_df.s.where(compile_df.b > 0), ['x', None]),
+                                           (compile_df.s.where(compile_df.b > 0).astype('category'), ['x', np.nan]),
+                                           (compile_df.s.astype('category'), {'y', 'w'}),
+                                           (pd.Series(pd.date_range('2020', periods=50, freq='H')),
+                                            pd.date_range('2020-01-02', periods=5, freq='H')),
+                                           (pd.Series(rng.randint(0, 100, 500)), []),
+                                           (pd.Series([1, 0, 2]), [True]),
+                                           (pd.Series([1., 0., 2.]), [False]),
+                                           (pd.Series(rng.randint(0, 10 ** 7, 500)), rng.choice(10 ** 7, 2000))]
+)
+def test_isin_lookup(series, values):
+    from pandasbikeshed.fancyfilter import IsinLookup
+    lookup = IsinLookup(values)
+    expected = series.isin(list(values))
+    assert_series_equal(lookup.contains(series), expected)
+    frame = series.to_frame('x')
+    assert_series_equal(me.x.isin(lookup)(frame), expected.rename('x'))
+    assert_series_equal(me.x.notin(lookup)(frame, internal=True), ~expected.rename('x'))
+
+sorted_df = pd.DataFrame({'t': pd.date_range('2020', periods=100, freq='H'),
+                          'i': np.repeat(np.arange(50), 2),
+                          'x': np.sort(rng.normal(size=100).round(1)),
+                          'w': sorted(rng.choice([*'abcdef'], size=100)),
+                          'a': compile_df.a})
+
+@pytest.mark.parametrize('expr', [(me.t >= pd.Timestamp('2020-01-02')) & (me.t < pd.Timestamp('2020-01-03')),
+                                  (me.i > 3) & (me.i <= 7.5) & (me.a > 0),
+                                  (me.i == 10) | (me.x < -1),
+                                  (me.x >= 0.) & (me.x < 0.5) & (me.w != 'c'),
+                                  (me.w >= 'b') & (me.w < 'd') & ~(me.i == 20),
+                                  (me.i > 60) & (me.a > 0),
+                                  me.i <= 20,
+                                  (me.a > 0) & (me.i > np.nan)]
+)
+def test_sorted_ranges(expr):
+    expected = expr(sorted_df, internal=True)
+    assert_series_equal(expr(sorted_df), expected, check_exact=True)
+    assert_series_equal(expr.compile(short_circuit=True)(sorted_df), expected, check_exact=True)
+    assert_frame_equal(expr.compile().select(sorted_df), sorted_df.loc[expected])
+    for name in ['t', 'i', 'x', 'w']:
+        indexed = sorted_df.set_index(name)
+        expected = np.asarray(expr(indexed, internal=True))
+        np.testing.assert_array_equal(np.asarray(expr(indexed)), expected)
+        assert_frame_equal(expr.compile().select(indexed), indexed.loc[expected])
+
+def test_sorted_ranges_opaque():
+    from pandasbikeshed.fancyfilter import OpsFilter
+    indexed = sorted_df.set_index('i')
+    above_mean = OpsFilter(me.a, lambda x, inner: inner(x) > inner(x).mean())
+    for expr in [(me.i >= 20) & above_mean, (me.i > 20) & (me.a == list(indexed.a))]:
+        expected = np.asarray(expr(indexed, internal=True))
+        np.testing.assert_array_equal(np.asarray(expr(indexed)), expected)
+        assert_frame_equal(expr.compile().select(indexed), indexed.loc[expected])
+
+@pytest.mark.parametrize('expr', [me.i == '2', me.x > '2', me.w > 1, me.t > '2020-01-02'])
+def test_sorted_ranges_mismatched_types(expr):
+    for name in ['t', 'i', 'x', 'w']:
+        indexed = sorted_df.set_index(name)
+        try:
+            expected = np.asarray(expr(indexed, internal=True))
+        except TypeError:
+            with pytest.raises(TypeError):
+                expr(indexed)
+            with pytest.raises(TypeError):
+                expr.compile().select(indexed)
+            continue
+        np.testing.assert_array_equal(np.asarray(expr(indexed)), expected)
+        assert_frame_equal(expr.compile().select(indexed), indexed.loc[expected])
+
+def test_mask_cache():
+    import gc
+    from pandasbikeshed.fancyfilter import MaskCache, use_mask_cache
+    frame = compile_df.copy()
+    cache = MaskCache(max_bytes=3 * len(frame))
+    expr = (me.a > 0) & (me.s != 'x')
+    assert_frame_equal(frame.loc[expr.compile(cache=cache)], frame.loc[(frame.a > 0) & (frame.s != 'x')])
+    assert_frame_equal(frame.loc[((me.a > 0) & (me.s != 'x')).compile(cache=cache)], frame.loc[expr])
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    frame.loc[0, 'a'] = 100.
+    cache.invalidate(frame)
+    assert_series_equal(expr.compile(cache=cache)(frame), (frame.a > 0) & (frame.s != 'x'))
+    frame['s'] = 'y'
+    assert_series_equal(expr.compile(cache=cache)(frame), frame.a > 0, check_names=False)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 3
+    previous = use_mask_cache(cache)
+    try:
+        for threshold in range(4):
+            frame.loc[me.b > threshold]
+    finally:
+        use_mask_cache(previous)
+    assert cache.stats()['evictions'] == 2 and len(cache) == 3
+    del frame
+    gc.collect()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+def test_mask_cache_constants_and_writes():
+    from pandasbikeshed.fancyfilter import MaskCache, use_mask_cache
+    frame = pd.DataFrame({'a': np.arange(1000) % 50, 's': np.array(['x', 'y'])[np.arange(1000) % 2]})
+    cache = MaskCache(verify=True)
+    previous = use_mask_cache(cache)
+    try:
+        for k in list(range(50)) * 2:
+            # New constants may reuse the ids of collected ones
+            assert_frame_equal(frame.loc[me.a.isin([k])], frame.loc[frame.a == k])
+            assert_frame_equal(frame.loc[me.a > np.full(len(frame), k)], frame.loc[frame.a > k])
+        values = [1, 2]
+        expr = me.a.isin(values)
+        frame.loc[expr]
+        values.append(3)
+        assert_frame_equal(frame.loc[expr], frame.loc[frame.a.isin([1, 2, 3])])
+        expr = (me.a > 10) & (me.s == 'x')
+        frame.loc[expr]
+        hits = cache.hits
+        frame.loc[me.a > 10]
+        frame.loc[500, 'a'] = -1
+        frame.loc[501, 's'] = 'x'
+        assert_frame_equal(frame.loc[expr], frame.loc[(frame.a > 10) & (frame.s == 'x')])
+        frame.loc[expr]
+        assert cache.hits == hits + 1
+    finally:
+        use_mask_cache(previous)
+    # Without verification writes into the buffers need an explicit invalidation
+    cache = MaskCache()
+    expr = me.a > 10
+    expected = frame.loc[expr.compile(cache=cache)]
+    frame.loc[502, 'a'] = -1
+    assert_frame_equal(frame.loc[expr.compile(cache=cache)], expected)
+    cache.invalidate(frame)
+    assert_frame_equal(frame.loc[expr.compile(cache=cache)], frame.loc[frame.a > 10])
+    frame['a'] = frame['a'] + 1
+    assert_frame_equal(frame.loc[expr.compile(cache=cache)], frame.loc[frame.a > 10])
+    assert cache.hits == 1 and cache.misses == 3
+
+
+def test_explain(capsys):
+    expr = ((me.a > 0) & (me.b < 1 - me.a)) | (me.a > 0)
+    expr.explain()
+    assert capsys.readouterr().out.splitlines() == [
+        '|',
+        '├── &',
+        '│   ├── > *',
+        '│   │   ├── me.a',
+        '│   │   └── 0',
+        '│   └── <',
+        '│       ├── me.b',
+        '│       └── -',
+        '│           ├── 1',
+        '│           └── me.a',
+        '└── > *',
+        '    ├── me.a',
+        '    └── 0',
+    ]
+
+
+def test_profile():
+    records = []
+    expr = (me.a > 0) & ~me.s.isin(['x', 'y'])
+    report = expr.profile(compile_df, hook=records.append)
+    assert list(report.index) == ["((me.a > 0) & (~me.s.isin(['x', 'y'])))", '(me.a > 0)', 'me.a', '0',
+                                  "(~me.s.isin(['x', 'y']))", "me.s.isin(['x', 'y'])", 'me.s', "['x', 'y']"]
+    assert [record['node'] for record in records] == list(report.index)
+    assert (report.calls == 1).all() and (report.time >= 0).all()
+    assert (report.cumulative_time >= report.time).all()
+    assert report.loc['(me.a > 0)', 'rows'] == len(compile_df)
+    assert report.loc['(me.a > 0)', 'selectivity'] == (compile_df.a > 0).mean()
+    assert report.loc[report.index[0], 'selectivity'] == expr(compile_df).mean()
+    assert report.loc['me.a', 'dtype'] == str(compile_df.a.dtype)
+    short = expr.profile(compile_df, short_circuit=True)
+    assert short.loc["me.s.isin(['x', 'y'])", 'rows'] == (compile_df.a > 0).sum()
+
+
+@pytest.mark.parametrize('ordered', [False, True])
+def test_categorical_codes(ordered):
+    categories = [f'c{i}' for i in range(20)]
+    frame = pd.DataFrame({'c': pd.Categorical(rng.choice(categories + [None], 500), categories=categories,
+                                              ordered=ordered)})
+    exprs = [me.c == 'c3', me.c != 'c3', me.c == 'missing', me.c != 'missing', me.c == np.nan,
+             me.c.isin(['c1', 'c2', 'c3', 'c9']), me.c.isin(['c1', np.nan]), me.c.notin(['c0', 'missing']),
+             me.c.isin(categories[::2]), me.c.isin([]), ~me.c.isin(['c19', 'c0'])]
+    if ordered:
+        exprs += [me.c > 'c10', me.c >= 'c10', me.c < 'c10', me.c <= 'c10', 'c5' < me.c]
+    for expr in exprs:
+        assert_series_equal(expr.compile()(frame), expr(frame, internal=True), check_exact=True)
+    with pytest.raises(TypeError):
+        (me.c > 'missing' if ordered else me.c > 'c3')(frame)
+
+
+def test_filter_batch():
+    from pandasbikeshed.fancyfilter import FilterBatch
+    frame = pd.DataFrame({'a': rng.normal(size=1001), 'b': rng.randint(0, 10, 1001),
+                          'n': pd.array(rng.choice([1, 2, None], 1001), dtype='Int64')})
+    filters = {f'b{i}': (me.b == i) & (me.a > 0) for i in range(10)}
+    filters.update(na=me.n > 1, series=me.a > pd.Series(0., index=frame.index))
+    batch = FilterBatch(filters, block_size=100)
+    assert not any(hasattr(batch, name) for name in ('select', 'explain', 'profile'))
+    listed = FilterBatch([(me.a > 0) & (me.b == [1] * len(frame))], block_size=64).masks(frame)[0]
+    assert_series_equal(listed, (frame.a > 0) & (frame.b == 1), check_names=False)
+    expected = pd.DataFrame({name: expr(frame, internal=True).fillna(False).astype(bool)
+                             for name, expr in filters.items()})
+    assert_frame_equal(batch.masks(frame), expected)
+    assert_series_equal(batch.counts(frame), expected.sum())
+    packed = batch.packed(frame)
+    assert packed.shape == (12, 126)
+    for i, name in enumerate(batch.names):
+        assert (np.unpackbits(packed[i], count=len(frame), bitorder='little') == expected[name]).all()
+        assert (batch.indices(frame)[name] == np.flatnonzero(expected[name])).all()
+    with pytest.raises(TypeError):
+        FilterBatch([me.a + 1]).counts(frame)
+
+
+def test_plain_array():
+    values = np.arange(5)
+    np.testing.assert_array_equal((me > 1)(values), values > 1)
+    np.testing.assert_array_equal(((me > 1) & (me < 4)).compile()(values), (values > 1) & (values < 4))
+
+def test_array_backends():
+    from pandasbikeshed.fancyfilter import register_backend
+    records = np.zeros(100, dtype=[('a', 'f8'), ('b', 'i4'), ('s', 'U1')])
+    records['a'] = rng.normal(size=100)
+    records['a'][::7] = np.nan
+    records['b'] = rng.randint(0, 10, 100)
+    records['s'] = rng.choice(['x', 'y'], 100)
+    frame = pd.DataFrame(records)
+    columns = {name: records[name] for name in records.dtype.names}
+    exprs = [(me.a > 0) & (me.b < 5), ~(me.a > 0) | (me.s == 'x'), me.s.isin(['x']), me.a.isna(), (me.b // 2) == 1]
+    for expr in exprs:
+        for obj in (records, columns):
+            mask = expr(obj)
+            assert isinstance(mask, np.ndarray) and mask.dtype == bool
+            assert (mask == expr(frame).values).all()
+    with pytest.raises(KeyError):
+        (me.c > 0)(columns)
+
+    class Columns(object):
+        def __init__(self, frame):
+            self.frame = frame
+
+    register_backend(Columns, lambda obj, name: obj.frame[name].values, length=lambda obj: len(obj.frame))
+    assert (((me.a > 0) & (me.b < 5))(Columns(frame)) == ((frame.a > 0) & (frame.b < 5)).values).all()
+
+
+def test_arrow_backend():
+    pa = pytest.importorskip('pyarrow')
+    from pandasbikeshed.fancyfilter import IsinLookup
+    b = rng.randint(0, 10, 100)
+    table = pa.table({'a': rng.normal(size=100), 'b': pa.array(np.where(b == 3, None, b).tolist(), type=pa.int64()),
+                      's': rng.choice(['x', 'y', 'z'], 100)})
+    frame = table.to_pandas()
+    exprs = [(me.a > 0) & (me.b < 5), me.b != 4, ~(me.b > 2) | (me.s == 'x'), me.b.isin([1, 2, np.nan]),
+             me.b.notin(IsinLookup([1, 2])), me.b.notna(), (me.b / 0) > 1, (1 - me.b) * me.a > 0, (me.b % 3) == 0]
+    for expr in exprs:
+        mask = expr(table)
+        assert isinstance(mask, (pa.Array, pa.ChunkedArray)) and mask.null_count == 0
+        assert (np.asarray(mask) == expr(frame).values).all()
+    assert table.filter((me.a > 0)(table)).num_rows == (frame.a > 0).sum()
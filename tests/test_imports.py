@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+import pytest
+
+# On Python 3.6 the package imports its submodules eagerly
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 7), reason='lazy imports need module __getattr__ (PEP 562)')
+
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'scipy']
+
+
+def imported_modules(statement):
+    code = f'import sys\n{statement}\nprint(" ".join(sys.modules))'
+    return subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout.split()
+
+
+@pytest.mark.parametrize('statement', ['import pandasbikeshed',
+                                       'from pandasbikeshed.fancyfilter import me',
+                                       'from pandasbikeshed import flat_corr, me',
+                                       'import pandasbikeshed.basic_ops'])
+def test_core_import_is_light(statement):
+    modules = imported_modules(statement)
+    assert not [name for name in modules if name.split('.')[0] in HEAVY_MODULES]
+
+
+def test_lazy_attributes():
+    import pandasbikeshed as pb
+    assert pb.plot.corr_heatmap is not None
+    assert pb.flat_corr is pb.basic_ops.flat_corr
+    assert pb.me is pb.fancyfilter.me
+    with pytest.raises(AttributeError):
+        pb.not_a_submodule
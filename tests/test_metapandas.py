@@ -0,0 +1,34 @@
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import pytest
+
+from pandasbikeshed.metapandas import read_only_metadata_dict, read_with_metadata_dict
+
+content = '# run: 3\n# sample: A1\nx\ty\n1\t#a\n2\tb\n3\tc\n'
+expected = pd.DataFrame({'x': [1, 2, 3], 'y': ['#a', 'b', 'c']})
+metadata = {'run': 3, 'sample': 'A1'}
+
+@pytest.fixture
+def meta_file(tmp_path):
+    path = tmp_path / 'data.tsv'
+    path.write_text(content)
+    return path
+
+def test_read_with_metadata_dict(meta_file):
+    data, meta = read_with_metadata_dict(meta_file)
+    assert meta == metadata
+    assert_frame_equal(data, expected)
+    assert read_only_metadata_dict(meta_file) == metadata
+
+def test_read_with_metadata_dict_chunks(meta_file):
+    chunks = list(read_with_metadata_dict(meta_file, chunksize=2))
+    assert [len(chunk) for chunk, _ in chunks] == [2, 1]
+    assert all(meta == metadata for _, meta in chunks)
+    assert_frame_equal(pd.concat([chunk for chunk, _ in chunks]), expected)
+
+def test_read_with_metadata_dict_pyarrow(meta_file):
+    pytest.importorskip('pyarrow')
+    data, meta = read_with_metadata_dict(meta_file, engine='pyarrow')
+    assert meta == metadata
+    assert_frame_equal(data, expected)
@@ -10,11 +10,14 @@ import pytest
 
 from pandasbikeshed.plot import (robust_hist,
                                  robust_scatter,
+                                 robust_density,
                                  robust_info,
                                  robust_kde,
+                                 binned_kde,
                                  robust_pairplot,
                                  corr_heatmap,
-                                 dist_catplot)
+                                 dist_catplot,
+                                 render_batch)
 
 nan_df = pd_samples.makeMissingDataframe()
 nan_a = nan_df['A']
@@ -29,15 +32,69 @@ def test_robust_scatter():
     assert isinstance(robust_scatter(nan_a, nan_b), plt.Axes)
     assert isinstance(robust_scatter(nan_a.values, nan_b.values), plt.Axes)
 
+def test_robust_density():
+    ax = robust_density(nan_a, nan_b, bins=(10, 5))
+    assert isinstance(ax, plt.Axes)
+    counts = ax.images[-1].get_array()
+    assert counts.shape == (5, 10)
+    assert counts.sum() == (np.isfinite(nan_a) & np.isfinite(nan_b)).sum()
+    ax = robust_scatter(nan_a, nan_b, density_threshold=5)
+    assert len(ax.images) > 0
+
 def test_robust_kde():
     assert isinstance(robust_kde(nan_a), plt.Axes)
     assert isinstance(robust_kde(nan_a, nan_b), plt.Axes)
+    assert isinstance(robust_kde(nan_a, fft_threshold=0), plt.Axes)
+    assert isinstance(robust_kde(nan_a, nan_b, fft_threshold=0, color='k'), plt.Axes)
+
+def test_binned_kde():
+    from scipy.stats import gaussian_kde
+    values = np.random.RandomState(0).normal(size=(2, 1000))
+    grid, density = binned_kde(values[0])
+    np.testing.assert_allclose(density, gaussian_kde(values[0])(grid), atol=2e-3)
+    x_grid, y_grid, density = binned_kde(*values, gridsize=50)
+    xx, yy = np.meshgrid(x_grid, y_grid)
+    expected = gaussian_kde(values)(np.vstack([xx.ravel(), yy.ravel()])).reshape(xx.shape)
+    np.testing.assert_allclose(density, expected, atol=2e-3)
+
+def test_binned_kde_singular():
+    constant = pd.Series(np.ones(1000))
+    assert binned_kde(constant) is None
+    assert binned_kde(np.array([])) is None
+    assert binned_kde(nan_a.dropna(), 2 * nan_a.dropna()) is None
+    with pytest.warns(UserWarning, match='0 variance'):
+        assert isinstance(robust_kde(constant, fft_threshold=0), plt.Axes)
+    with pytest.warns(UserWarning, match='0 variance'):
+        assert isinstance(robust_kde(nan_a, 2 * nan_a, fft_threshold=0), plt.Axes)
+    with pytest.warns(UserWarning, match='0 variance'):
+        robust_pairplot(pd.DataFrame({'A': np.arange(100001.), 'C': 1.}), diag_kind='kde', lower_kind='density')
+    plt.close('all')
 
 def test_robust_info():
     assert isinstance(robust_info(nan_a, nan_b), plt.Axes)
     assert isinstance(robust_info(nan_a.values, nan_b.values), plt.Axes)
 
-@pytest.mark.parametrize('kwargs_dict', [dict(), {'lower_kind': 'kde'}, {'diag_kind': 'kde'}])
+def test_robust_pairplot_info():
+    res = robust_pairplot(nan_df)
+    for i, x in enumerate(nan_df.columns):
+        for j, y in enumerate(nan_df.columns[i + 1:], i + 1):
+            fig, ax = plt.subplots()
+            robust_info(nan_df[y].values, nan_df[x].values, ax=ax)
+            assert res.axes[i, j].texts[0].get_text() == ax.texts[0].get_text()
+            plt.close(fig)
+
+def test_robust_pairplot_sample():
+    offsets = lambda g: g.axes[1, 0].collections[0].get_offsets()
+    res = robust_pairplot(nan_df, max_points=10, seed=1)
+    assert len(offsets(res)) == 10
+    assert np.array_equal(offsets(res), offsets(robust_pairplot(nan_df, max_points=10, seed=1)))
+    full = robust_pairplot(nan_df)
+    for i in range(len(nan_df.columns)):
+        for j in range(i + 1, len(nan_df.columns)):
+            assert res.axes[i, j].texts[0].get_text() == full.axes[i, j].texts[0].get_text()
+    plt.close('all')
+
+@pytest.mark.parametrize('kwargs_dict', [dict(), {'lower_kind': 'kde'}, {'diag_kind': 'kde'}, {'upper_kind': 'density'}])
 def test_robust_pairplot(kwargs_dict):
     res = robust_pairplot(nan_df, **kwargs_dict)
     assert isinstance(res, sns.PairGrid)
@@ -47,6 +104,24 @@ def test_corr_heatmap():
     assert isinstance(corr_heatmap(nan_df), plt.Axes)
     assert isinstance(corr_heatmap(nan_df, method='spearman'), plt.Axes)
     assert isinstance(corr_heatmap(nan_df, triangle_only=False), plt.Axes)
+    assert isinstance(corr_heatmap(nan_df, engine='blas'), plt.Axes)
+    assert isinstance(corr_heatmap(nan_df, cluster=True), plt.Axes)
+
+def test_corr_heatmap_raster():
+    wide = pd.DataFrame(np.random.RandomState(0).normal(size=(50, 120)))
+    fig, ax = plt.subplots()
+    corr_heatmap(wide, ax=ax, raster=True, cluster=True, max_pixels=50, max_ticks=20)
+    image = ax.get_images()[0].get_array()
+    assert image.shape == (40, 40)
+    assert len(ax.get_xticks()) == 20
+    assert image.mask[0, -1] and not image.mask[-1, 0]
+    plt.close(fig)
+    fig, ax = plt.subplots()
+    corr_heatmap(wide, ax=ax, raster_threshold=100, xticklabels=False)
+    assert not ax.get_images() and not len(ax.get_xticks())
+    with pytest.warns(UserWarning, match='xticklabels'):
+        corr_heatmap(wide, ax=ax, raster=True, xticklabels=False)
+    plt.close(fig)
 
 def test_dist_catplot():
     assert isinstance(dist_catplot(nan_df,), sns.FacetGrid)
@@ -58,3 +133,30 @@ def test_dist_catplot():
     assert isinstance(dist_catplot(mixed_df, hue='C'), sns.FacetGrid)
     assert isinstance(dist_catplot(mixed_df, x='A', col='C'), sns.FacetGrid)
 
+def test_dist_catplot_wide_hist():
+    g = dist_catplot(mixed_df, hue='C', bins=5)
+    assert g.axes.shape == (1, 2)
+    for ax, name in zip(g.axes.flat, ['A', 'B']):
+        heights = [patch.get_height() for patch in ax.patches]
+        edges = np.histogram_bin_edges(mixed_df[name].dropna(), bins=5)
+        expected = [np.histogram(group.dropna(), bins=edges)[0] for _, group in mixed_df.groupby('C')[name]]
+        assert np.array_equal(heights, np.concatenate(expected))
+    missing_hue = mixed_df.assign(C=mixed_df['C'].where(mixed_df.index != 2))
+    g = dist_catplot(missing_hue, hue='C', bins=5)
+    heights = [patch.get_height() for patch in g.axes[0, 0].patches]
+    assert sum(heights) == missing_hue['C'].notna().sum()
+    shared = dist_catplot(mixed_df, bins=5, shared_bins=True)
+    assert shared.axes[0, 0].patches[0].get_x() == shared.axes[0, 1].patches[0].get_x()
+    plt.close('all')
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_render_batch(tmp_path, n_jobs):
+    mixed = nan_df.assign(label=np.arange(len(nan_df)) % 3, name='x')
+    specs = [dict(func=corr_heatmap, path=str(tmp_path / 'heat.png')),
+             (dist_catplot, 'mixed', {'dist_columns': ['A', 'B']}, str(tmp_path / 'dist.png')),
+             (corr_heatmap, 0, {'method': 'unknown'}, str(tmp_path / 'error.png'))]
+    res = render_batch(specs, {0: nan_df, 'mixed': mixed}, n_jobs=n_jobs)
+    assert list(res.path) == [spec['path'] if isinstance(spec, dict) else spec[3] for spec in specs]
+    assert res.error[:2].isna().all() and 'ValueError' in res.error[2]
+    assert (tmp_path / 'heat.png').exists() and (tmp_path / 'dist.png').exists()